@@ -0,0 +1,308 @@
+"""Synthetic outSplineData blobs and decoder benchmarks, no Maya needed.
+
+makeSplineBlob() writes blobs in the layout XGenSplineData parses: 16 byte block headers, a json header block with
+Items/RefMeshArray, then one block per group, deflated (32 byte group header + zlib), raw, and/or base64 encoded.
+
+    python XGenSplineBench.py --strands 100000 --cvs 4 16 --groups 8
+    python XGenSplineBench.py --strands 20000 --raw --channels PrimitiveInfos Positions
+    python XGenSplineBench.py --write groom.bin
+    python XGenSplineBench.py --group-counts --order-counts 10000 100000 1000000 5000000
+"""
+import argparse
+import array
+import base64
+import json
+import random
+import struct
+import time
+import tracemalloc
+import zlib
+
+import XGenSplineData as xsd
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+XGenBlobChannels = ('PrimitiveInfos', 'Positions', 'WIDTH_CV', 'FaceId', 'FaceUV')
+# the parser ignores type codes, these only keep the blocks apart when looking at a hex dump
+HeaderBlockType = 1
+GroupBlockType = 2
+ChannelBlockType = 3
+# the per-strand tuple sort is only timed up to this many strands, it takes minutes beyond
+OrderReferenceLimit = 1000000
+
+
+def packBlock(typeCode, payload):
+    return struct.pack('<I4xQ', typeCode, len(payload)) + payload
+
+
+def randomFloats(rnd, count, low, high):
+    if np is not None:
+        return rnd.uniform(low, high, count).astype('<f4').tobytes()
+    return array.array('f', [rnd.uniform(low, high) for _ in range(count)]).tobytes()
+
+
+def packChannel(key, rnd, offsets, lengths):
+    numStrands = len(lengths)
+    numCVs = sum(lengths)
+    if key == 'PrimitiveInfos':
+        words = array.array('I', [0] * (numStrands * 3))
+        words[0::3] = array.array('I', offsets)
+        words[1::3] = array.array('I', lengths)
+        return words.tobytes()
+    if key == 'Positions':
+        return randomFloats(rnd, numCVs * 3, -10.0, 10.0)
+    if key == 'WIDTH_CV':
+        return randomFloats(rnd, numCVs, 0.01, 0.1)
+    if key == 'FaceUV':
+        return randomFloats(rnd, numStrands * 2, 0.0, 1.0)
+    if key == 'FaceId':
+        if np is not None:
+            return rnd.integers(0, 1024, numStrands).astype('<i4').tobytes()
+        return array.array('i', [rnd.randint(0, 1023) for _ in range(numStrands)]).tobytes()
+    raise Exception("Unknown channel %s" % key)
+
+
+def makeSplineBlob(numStrands, cvs=(4, 16), numGroups=1, channels=XGenBlobChannels, deflate=True, base64Groups=False,
+                   seed=0):
+    # cvs is the (min, max) number of CVs per strand, strands are spread evenly over the groups
+    rnd = np.random.default_rng(seed) if np is not None else random.Random(seed)
+    items = []
+    groupBlocks = []
+    for group in range(numGroups):
+        count = numStrands // numGroups + (1 if group < numStrands % numGroups else 0)
+        if np is not None:
+            lengths = [int(n) for n in rnd.integers(cvs[0], cvs[1] + 1, count)]
+        else:
+            lengths = [rnd.randint(cvs[0], cvs[1]) for _ in range(count)]
+        offsets = [0] * count
+        for i in range(1, count):
+            offsets[i] = offsets[i - 1] + lengths[i - 1]
+
+        item = dict()
+        groupData = []
+        for index, key in enumerate(channels):
+            groupData.append(packBlock(ChannelBlockType, packChannel(key, rnd, offsets, lengths)))
+            item[key] = (group << 32) | index
+        items.append(item)
+
+        groupData = b''.join(groupData)
+        if deflate:
+            compressed = zlib.compress(groupData)
+            groupData = struct.pack('<QQ16x', len(groupData), len(compressed)) + compressed
+        if base64Groups:
+            groupData = base64.b64encode(groupData)
+        groupBlocks.append(packBlock(GroupBlockType, groupData))
+
+    header = {'Header': {'GroupBase64': base64Groups, 'GroupDeflate': deflate}, 'Items': items, 'RefMeshArray': []}
+    return bytearray(packBlock(HeaderBlockType, json.dumps(header).encode()) + b''.join(groupBlocks))
+
+
+def timeIt(func, repeat):
+    # best of repeat runs
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(stage, numBytes, numStrands, elapsed):
+    print("  %-26s %9.3f ms %10.1f MB/s %14.0f strands/s" % (stage, elapsed * 1000, numBytes / elapsed / 1e6,
+                                                              numStrands / elapsed))
+
+
+def setWorkers(workers, minGroupSize=None):
+    xsd.inflate_workers = workers
+    if minGroupSize is not None:
+        xsd.inflate_min_group_size = minGroupSize
+
+
+def sliceToEndInflate(rawData, dataBlocks, groups):
+    # the group inflate inflateGroups replaced, the reference: every group is sliced from its start to the end of the
+    # blob before it is inflated, so each group copies all bytes after it
+    return dict((group, zlib.decompress(rawData[dataBlocks[group][0] + 32:])) for group in groups)
+
+
+def inflateInputBytes(rawData, dataBlocks, groups, toEnd):
+    # bytes handed to zlib: each group's own extent, or everything from its start to the end of the blob. the slice
+    # to end copies all of them first, the bounded inflate reads a memoryview of the group in place
+    return sum((len(rawData) if toEnd else dataBlocks[group][1]) - dataBlocks[group][0] - 32 for group in groups)
+
+
+def tracePeak(func):
+    # peak bytes python allocated while func ran, its inflated groups included
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def reportTraffic(stage, inputBytes, blobBytes, peakBytes):
+    print("  %-26s %9.1f MB read (%5.1fx the blob) %9.1f MB peak allocated" % (
+        stage, inputBytes / 1e6, float(inputBytes) / blobBytes, peakBytes / 1e6))
+
+
+def benchStages(blob, numStrands, keys, repeat):
+    # MB/s is measured on the bytes each stage walks or produces: all blocks, inflated groups, decoded channel blocks,
+    # gathered strand columns
+    data = xsd.XGenSplineData(blob)
+    groups = list(range(len(data.groupBlocks)))
+    decoded = xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header)
+    groupBytes = sum(len(validData) for validData in decoded.values())
+    print("blob: %d bytes, %d groups, %d strands, %d bytes of group data" % (len(blob), len(groups), numStrands,
+                                                                            groupBytes))
+
+    def walk():
+        list(xsd.iterBlocks(data.rawView))
+        for validData in decoded.values():
+            list(xsd.iterBlocks(memoryview(validData)))
+
+    report('block walk', len(blob) + groupBytes, numStrands, timeIt(walk, repeat))
+
+    if data.header['GroupDeflate'] or data.header['GroupBase64']:
+        oldWorkers = xsd.inflate_workers
+        setWorkers(1)
+        report('inflate (serial)', groupBytes, numStrands,
+               timeIt(lambda: xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header), repeat))
+        setWorkers(oldWorkers)
+        if oldWorkers > 1:
+            report('inflate (%d workers)' % oldWorkers, groupBytes, numStrands,
+                   timeIt(lambda: xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header), repeat))
+        if data.header['GroupDeflate'] and not data.header['GroupBase64']:
+            if sliceToEndInflate(blob, data.groupBlocks, groups) != dict(
+                    (group, bytes(validData)) for group, validData in decoded.items()):
+                raise Exception("inflateGroups differs from the slice to end inflate")
+            report('inflate (slice copy)', groupBytes, numStrands,
+                   timeIt(lambda: sliceToEndInflate(blob, data.groupBlocks, groups), repeat))
+            setWorkers(1)
+            reportTraffic('inflate (serial)', inflateInputBytes(blob, data.groupBlocks, groups, False), len(blob),
+                          tracePeak(lambda: xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header)))
+            setWorkers(oldWorkers)
+            reportTraffic('inflate (slice copy)', inflateInputBytes(blob, data.groupBlocks, groups, True), len(blob),
+                          tracePeak(lambda: sliceToEndInflate(blob, data.groupBlocks, groups)))
+
+    data.groups = dict((group, xsd.XGenGroup(validData)) for group, validData in decoded.items())
+    channelBytes = sum(len(data.block(*addr)) for k in keys for addr in data.items.get(k, ()))
+
+    def decode():
+        data.channels.clear()
+        for k in keys:
+            data.channel(k)
+
+    report('channel decode', channelBytes, numStrands, timeIt(decode, repeat))
+
+    columnKeys = tuple(k for k in keys if k in xsd.XGenChannelFormats)
+    strands = xsd.gatherStrands(data, columnKeys)
+    strandBytes = sum(values.itemsize * len(values) for values in strands.columns().values() if values is not None)
+    report('strand gather', strandBytes, numStrands, timeIt(lambda: xsd.gatherStrands(data, columnKeys), repeat))
+    report('getXgenData total', len(blob), numStrands, timeIt(lambda: xsd.XGenSplineData(blob).read(keys), repeat))
+
+
+def benchGroupCounts(numStrands, cvs, groupCounts, keys, deflate, base64Groups, repeat):
+    # the same strands split into more and more groups: inflate MB/s should stay flat (traffic is linear in
+    # blob size), and the thread pool should pull ahead once there are several large groups. for deflated groups the
+    # bytes read and python's peak allocation are printed next to the slice to end reference, whose reads grow with
+    # the square of the group count
+    print("group scaling, %d strands, inflate_min_group_size %d" % (numStrands, xsd.inflate_min_group_size))
+    oldWorkers = xsd.inflate_workers
+    for numGroups in groupCounts:
+        blob = makeSplineBlob(numStrands, cvs, numGroups, keys, deflate, base64Groups)
+        data = xsd.XGenSplineData(blob)
+        groups = list(range(len(data.groupBlocks)))
+        groupBytes = sum(len(validData) for validData in
+                         xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header).values())
+        for workers in sorted(set([1, oldWorkers])):
+            setWorkers(workers)
+            elapsed = timeIt(lambda: xsd.inflateGroups(data.rawView, data.groupBlocks, groups, data.header), repeat)
+            report('%4d groups, %d workers' % (numGroups, workers), groupBytes, numStrands, elapsed)
+        if deflate and not base64Groups:
+            elapsed = timeIt(lambda: sliceToEndInflate(blob, data.groupBlocks, groups), repeat)
+            report('%4d groups, slice copy' % numGroups, groupBytes, numStrands, elapsed)
+            setWorkers(1)
+            reportTraffic('%4d groups, bounded' % numGroups, inflateInputBytes(blob, data.groupBlocks, groups, False),
+                          len(blob), tracePeak(lambda: xsd.inflateGroups(data.rawView, data.groupBlocks, groups,
+                                                                          data.header)))
+            reportTraffic('%4d groups, slice copy' % numGroups, inflateInputBytes(blob, data.groupBlocks, groups, True),
+                          len(blob), tracePeak(lambda: sliceToEndInflate(blob, data.groupBlocks, groups)))
+    setWorkers(oldWorkers)
+
+
+def makeRootKeys(numStrands, seed=0):
+    # FaceId/FaceUV columns with many ties (few faces, uvs on a coarse grid), so the index tie-break matters
+    numFaces = max(1, numStrands // 100)
+    if np is not None:
+        rnd = np.random.default_rng(seed)
+        return (rnd.integers(0, numFaces, numStrands).astype('<i4'),
+                (rnd.integers(0, 64, numStrands * 2) / 64.0).astype('<f4'))
+    rnd = random.Random(seed)
+    return (array.array('i', [rnd.randrange(numFaces) for _ in range(numStrands)]),
+            array.array('f', [rnd.randrange(64) / 64.0 for _ in range(numStrands * 2)]))
+
+
+def tupleIndex2Order(faceIds, faceUVs):
+    # the per-strand (key, index) tuple sort rootIndex2Order replaced, the reference ordering
+    keys = [(faceId, faceUVs[i * 2], faceUVs[i * 2 + 1]) for i, faceId in enumerate(faceIds)]
+    index2order = [0] * len(keys)
+    for sortedIndex, (_, i) in enumerate(sorted((key, i) for i, key in enumerate(keys))):
+        index2order[i] = sortedIndex
+    return index2order
+
+
+def benchOrdering(counts, repeat):
+    print("strand ordering by root (faceId, u, v)")
+    for numStrands in counts:
+        faceIds, faceUVs = makeRootKeys(numStrands)
+        keyBytes = numStrands * 12
+        index2order = xsd.rootIndex2Order(faceIds, faceUVs)
+        report('%8d rootIndex2Order' % numStrands, keyBytes, numStrands,
+               timeIt(lambda: xsd.rootIndex2Order(faceIds, faceUVs), repeat))
+        if numStrands > OrderReferenceLimit:
+            continue
+        if list(index2order) != tupleIndex2Order(faceIds, faceUVs):
+            raise Exception("rootIndex2Order differs from the tuple sort for %d strands" % numStrands)
+        report('%8d tuple sort' % numStrands, keyBytes, numStrands,
+               timeIt(lambda: tupleIndex2Order(faceIds, faceUVs), min(repeat, 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--strands', type=int, default=100000)
+    parser.add_argument('--cvs', type=int, nargs=2, default=(4, 16), metavar=('MIN', 'MAX'))
+    parser.add_argument('--groups', type=int, default=8)
+    parser.add_argument('--channels', nargs='+', default=XGenBlobChannels, choices=XGenBlobChannels)
+    parser.add_argument('--raw', action='store_true', help="groups are not deflated")
+    parser.add_argument('--base64', action='store_true', help="groups are base64 encoded")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=xsd.inflate_workers)
+    parser.add_argument('--group-counts', type=int, nargs='*', default=(1, 4, 16, 64, 256))
+    parser.add_argument('--order-counts', type=int, nargs='*', default=(),
+                        help="time strand ordering for these strand counts")
+    parser.add_argument('--write', metavar='PATH', help="write the generated blob and exit")
+    args = parser.parse_args()
+
+    if 'PrimitiveInfos' not in args.channels:
+        args.channels = ['PrimitiveInfos'] + list(args.channels)
+    blob = makeSplineBlob(args.strands, args.cvs, args.groups, args.channels, not args.raw, args.base64)
+    if args.write:
+        with open(args.write, 'wb') as f:
+            f.write(blob)
+        return
+    setWorkers(args.workers)
+    print("numpy: %s" % ('yes' if np is not None else 'no'))
+    benchStages(blob, args.strands, args.channels, args.repeat)
+    if args.group_counts:
+        benchGroupCounts(args.strands, args.cvs, args.group_counts, args.channels, not args.raw, args.base64,
+                         args.repeat)
+    if args.order_counts:
+        benchOrdering(args.order_counts, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
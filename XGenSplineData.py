@@ -0,0 +1,601 @@
+"""Maya-free reader for the outSplineData blob of XGen interactive grooms.
+
+The exporters carry the same parser inline so they stay single file tools, this module is that parser on its own,
+so decoding can be profiled and checked on machines without Maya. Blobs are captured in Maya with
+captureSplineBlobs() from either exporter.
+
+    python XGenSplineData.py groom.0001.bin [groom.0002.bin ...]
+"""
+import array
+import bisect
+import itertools
+import json
+import os
+import struct
+import sys
+import zlib
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# deflated groups are inflated on a thread pool, zlib releases the GIL while inflating.
+# inflate_workers <= 1 keeps it serial, groups smaller than inflate_min_group_size (compressed bytes) stay serial
+inflate_workers = min(8, os.cpu_count() or 1)
+inflate_min_group_size = 64 * 1024
+# GroupBase64 groups are decoded this many base64 characters at a time, keep it a multiple of 4
+base64_chunk_size = 256 * 1024
+
+
+# typecode, numpy dtype, components per element
+XGenChannelFormats = {
+    'Positions': ('f', '<f4', 3),
+    'WIDTH_CV': ('f', '<f4', 1),
+    'FaceUV': ('f', '<f4', 2),
+    'FaceId': ('i', '<i4', 1),
+}
+
+
+def decodeChannel(key, data):
+    typecode, dtype, components = XGenChannelFormats[key]
+    if np is not None:
+        # view over the inflated group buffer, no copy
+        values = np.frombuffer(data, dtype=dtype)
+        if components > 1:
+            values = values.reshape(-1, components)
+        return values
+    values = array.array(typecode)
+    values.frombytes(data)
+    return values
+
+
+if np is not None:
+    PrimitiveInfoDtype = np.dtype([('offset', '<u4'), ('length', '<u8')])
+
+
+def decodePrimitiveInfos(data):
+    # records are packed (uint32 offset, uint64 length), decoded in bulk into two parallel columns
+    if np is not None:
+        records = np.frombuffer(data, dtype=PrimitiveInfoDtype)
+        return records['offset'], records['length']
+    words = array.array('I')
+    words.frombytes(data)
+    if any(words[2::3]):
+        raise Exception("PrimitiveInfos length out of range")
+    return words[0::3], words[1::3]
+
+
+def iterBlocks(data):
+    # a block is a 16 byte header (uint32 type code, 4 unused bytes, uint64 size) followed by its data
+    dataLength = len(data)
+    address = 0
+    while address < dataLength - 1:
+        if address + 16 > dataLength:
+            raise Exception("Truncated block header at %d" % address)
+        type_code, size = struct.unpack_from('<I4xQ', data, address)
+        start = address + 16
+        end = start + size
+        if end > dataLength:
+            raise Exception("Block at %d is larger than the data (%d > %d)" % (address, end, dataLength))
+        yield start, end, type_code
+        address = end
+
+
+class XGenGroup:
+    # inflated group data, its block table is parsed once and blocks are served as views
+    def __init__(self, data):
+        self.data = data
+        self.view = memoryview(data)
+        self.blocks = list(iterBlocks(data))
+
+    def block(self, index):
+        start, end, _ = self.blocks[index]
+        return self.view[start:end]
+
+
+def inflateGroup(rawView, start, end):
+    # a deflated group is a 32 byte header followed by the zlib stream, only the group's own bytes are read
+    inflater = zlib.decompressobj()
+    data = inflater.decompress(rawView[start + 32:end])
+    if not inflater.eof:
+        raise Exception("Group data is truncated")
+    return data
+
+
+def decodeBase64Group(rawView, start, end, deflate):
+    # base64 text is decoded and inflated chunk by chunk, the decoded zlib stream is never held whole
+    inflater = zlib.decompressobj() if deflate else None
+    skip = 32 if deflate else 0
+    parts = []
+    for chunkStart in range(start, end, base64_chunk_size):
+        chunk = binascii.a2b_base64(rawView[chunkStart:min(chunkStart + base64_chunk_size, end)])
+        if skip:
+            skipped = min(skip, len(chunk))
+            chunk, skip = chunk[skipped:], skip - skipped
+        parts.append(inflater.decompress(chunk) if deflate else chunk)
+    if deflate and not inflater.eof:
+        raise Exception("Group data is truncated")
+    return b''.join(parts)
+
+
+def decodeGroup(rawView, start, end, header):
+    if header['GroupBase64']:
+        return decodeBase64Group(rawView, start, end, header['GroupDeflate'])
+    if header['GroupDeflate']:
+        return inflateGroup(rawView, start, end)
+    return rawView[start:end]
+
+
+def inflateGroups(rawView, dataBlocks, groups, header):
+    inflate = lambda group: decodeGroup(rawView, *dataBlocks[group][:2], header)
+    parallel = [group for group in groups if dataBlocks[group][1] - dataBlocks[group][0] >= inflate_min_group_size]
+    inflated = dict()
+    if inflate_workers > 1 and len(parallel) > 1:
+        with ThreadPoolExecutor(max_workers=min(inflate_workers, len(parallel))) as pool:
+            inflated.update(zip(parallel, pool.map(inflate, parallel)))
+    for group in groups:
+        if group not in inflated:
+            inflated[group] = inflate(group)
+    return inflated
+
+
+class XGenSplineData:
+    # parsed outSplineData blob: header, items, groups and decoded channels, no Maya needed
+    # previous is the XGenSplineData of the last frame, groups whose bytes did not change are taken from it until
+    # releasePrevious is called
+    def __init__(self, rawData, previous=None):
+        self.rawData = rawData
+        self.rawView = memoryview(rawData)
+        self.groupBlocks = list(iterBlocks(self.rawView))
+        headerBlock = self.groupBlocks.pop(0)
+        self.json = json.loads(bytes(self.rawView[headerBlock[0]:headerBlock[1]]))
+        self.header = self.json['Header']
+        self.items = dict()
+        for item in itertools.chain(self.json['Items'], self.json['RefMeshArray']):
+            for k, v in item.items():
+                if isinstance(v, int):
+                    self.items.setdefault(k, []).append((v >> 32, v & 0xFFFFFFFF))
+        self.groups = dict()
+        self.channels = dict()
+        self.groupHashes = dict()
+        self.reusedGroups = 0
+        self.previous = previous
+        if previous is not None:
+            # only keep one frame of history
+            previous.previous = None
+
+    def groupHash(self, group):
+        if group not in self.groupHashes:
+            start, end, _ = self.groupBlocks[group]
+            self.groupHashes[group] = zlib.crc32(self.rawView[start:end]) & 0xFFFFFFFF
+        return self.groupHashes[group]
+
+    def reuse(self, group):
+        # takes an inflated group and its decoded channels from the previous frame if its bytes are the same
+        previous = self.previous
+        if (previous is None or group not in previous.groups or group >= len(previous.groupBlocks)
+                or previous.header != self.header or previous.groupHash(group) != self.groupHash(group)):
+            return False
+        self.groups[group] = previous.groups[group]
+        for (key, addr), value in previous.channels.items():
+            if addr[0] == group:
+                self.channels[key, addr] = value
+        self.reusedGroups += 1
+        return True
+
+    def releasePrevious(self):
+        # the frame has been read: reused groups are held here, the previous blob and its other groups can go
+        self.previous = None
+
+    def hitRatio(self):
+        return float(self.reusedGroups) / len(self.groups) if self.groups else 0.0
+
+    def group(self, group):
+        if group not in self.groups and not self.reuse(group):
+            start, end, _ = self.groupBlocks[group]
+            self.groups[group] = XGenGroup(decodeGroup(self.rawView, start, end, self.header))
+        return self.groups[group]
+
+    def inflate(self, keys):
+        # inflate all groups holding these keys at once, so they can go through the thread pool
+        if not self.header['GroupDeflate'] and not self.header['GroupBase64']:
+            return
+        groups = sorted(set(addr[0] for k in keys for addr in self.items.get(k, ())).difference(self.groups))
+        groups = [group for group in groups if not self.reuse(group)]
+        for group, validData in inflateGroups(self.rawView, self.groupBlocks, groups, self.header).items():
+            self.groups[group] = XGenGroup(validData)
+
+    def block(self, group, index):
+        return self.group(group).block(index)
+
+    def decode(self, key, addr):
+        if (key, addr) not in self.channels:
+            data = self.block(*addr)
+            if key == 'PrimitiveInfos':
+                data = decodePrimitiveInfos(data)
+            elif key in XGenChannelFormats:
+                data = decodeChannel(key, data)
+            self.channels[key, addr] = data
+        return self.channels[key, addr]
+
+    def channel(self, key):
+        # one decoded entry per group, unknown keys are returned as raw block views
+        return [self.decode(key, addr) for addr in self.items.get(key, ())]
+
+    def read(self, keys):
+        self.inflate(keys)
+        return [self.channel(k) for k in keys]
+
+    def channelHash(self, keys):
+        # (bytes, crc32) over the raw blocks of these keys, their groups are inflated but nothing is decoded
+        self.inflate(keys)
+        numBytes = crc = 0
+        for k in keys:
+            for addr in self.items.get(k, ()):
+                data = self.block(*addr)
+                numBytes += len(data)
+                crc = zlib.crc32(data, crc)
+        return numBytes, crc & 0xFFFFFFFF
+
+
+# channels with one element per CV, the others have one element per strand
+XGenCVChannels = ('Positions', 'WIDTH_CV')
+
+
+def cvGatherIndex(offsets, lengths):
+    # numpy only, indices of offsets[i]:offsets[i] + lengths[i] for every strand, concatenated
+    starts = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum())) + np.repeat(offsets - starts, lengths)
+
+
+def takeRuns(values, runs, components):
+    # array.array only, values[start * components:(start + count) * components] for every (start, count), concatenated.
+    # adjacent runs are merged, so contiguous strands are copied with one slice
+    taken = array.array(values.typecode)
+    runStart = runEnd = None
+    for start, count in runs:
+        if start != runEnd:
+            if runEnd is not None:
+                taken.extend(values[runStart * components:runEnd * components])
+            runStart = start
+        runEnd = start + count
+    if runEnd is not None:
+        taken.extend(values[runStart * components:runEnd * components])
+    return taken
+
+
+class XGenStrands:
+    # all groups concatenated into contiguous, flat columns, strand i owns CVs offsets[i]:offsets[i + 1].
+    # positions hold 3 floats per CV, widths 1 per CV, faceIds 1 per strand, faceUVs 2 per strand
+    def __init__(self, lengths, positions=None, widths=None, faceIds=None, faceUVs=None):
+        self.lengths = lengths
+        self.numCurves = len(lengths)
+        if np is not None:
+            self.offsets = np.zeros(self.numCurves + 1, dtype=np.int64)
+            np.cumsum(lengths, out=self.offsets[1:])
+        else:
+            self.offsets = array.array('L', [0] * (self.numCurves + 1))
+            total = 0
+            for i, length in enumerate(lengths):
+                total += length
+                self.offsets[i + 1] = total
+        self.numCVs = int(self.offsets[-1])
+        self.positions = positions
+        self.widths = widths
+        self.faceIds = faceIds
+        self.faceUVs = faceUVs
+
+    def columns(self):
+        return dict(zip(('Positions', 'WIDTH_CV', 'FaceId', 'FaceUV'),
+                        (self.positions, self.widths, self.faceIds, self.faceUVs)))
+
+    def reorder(self, index2order):
+        # returns a new container where strand i is moved to index2order[i]
+        columns = dict()
+        if np is not None:
+            order = np.empty(self.numCurves, dtype=np.int64)
+            order[np.asarray(index2order, dtype=np.int64)] = np.arange(self.numCurves)
+            lengths = self.lengths[order]
+            cvIndex = cvGatherIndex(self.offsets[:-1][order], lengths)
+            for key, values in self.columns().items():
+                if values is not None:
+                    components = XGenChannelFormats[key][2]
+                    rows = cvIndex if key in XGenCVChannels else order
+                    columns[key] = values.reshape(-1, components)[rows].reshape(-1)
+        else:
+            order = [0] * self.numCurves
+            for i, sortedIndex in enumerate(index2order):
+                order[sortedIndex] = i
+            lengths = array.array('I', [self.lengths[i] for i in order])
+            cvRuns = [(self.offsets[i], self.lengths[i]) for i in order]
+            strandRuns = [(i, 1) for i in order]
+            for key, values in self.columns().items():
+                if values is not None:
+                    components = XGenChannelFormats[key][2]
+                    columns[key] = takeRuns(values, cvRuns if key in XGenCVChannels else strandRuns, components)
+        return XGenStrands(lengths, columns.get('Positions'), columns.get('WIDTH_CV'), columns.get('FaceId'),
+                           columns.get('FaceUV'))
+
+    def roots(self):
+        # first CV of every strand, float32 (numCurves, 3) with numpy, flat array.array otherwise
+        if np is not None:
+            return self.positions.reshape(-1, 3)[self.offsets[:-1]]
+        return takeRuns(self.positions, [(offset, 1) for offset in self.offsets[:-1]], 3)
+
+
+def gatherStrands(splineData, keys=()):
+    # keys are any of XGenChannelFormats, strands with less than 2 CVs are dropped from every column
+    splineData.inflate(('PrimitiveInfos',) + tuple(keys))
+    infos = splineData.channel('PrimitiveInfos')
+    channels = dict((key, splineData.channel(key)) for key in keys)
+    if np is not None:
+        lengthParts = []
+        parts = dict((key, []) for key in keys)
+        for j, (offsets, lengths) in enumerate(infos):
+            mask = lengths >= 2
+            offsets = offsets[mask].astype(np.int64)
+            lengths = lengths[mask].astype(np.int64)
+            cvIndex = cvGatherIndex(offsets, lengths)
+            lengthParts.append(lengths)
+            for key in keys:
+                components = XGenChannelFormats[key][2]
+                rows = cvIndex if key in XGenCVChannels else mask
+                parts[key].append(channels[key][j].reshape(-1, components)[rows].reshape(-1))
+        lengths = np.concatenate(lengthParts) if lengthParts else np.zeros(0, dtype=np.int64)
+        columns = dict((key, np.concatenate(parts[key]) if parts[key] else
+                        np.zeros(0, dtype=XGenChannelFormats[key][1])) for key in keys)
+    else:
+        lengths = array.array('I')
+        columns = dict((key, array.array(XGenChannelFormats[key][0])) for key in keys)
+        for j, (offsets, groupLengths) in enumerate(infos):
+            cvRuns = [(offset, length) for offset, length in zip(offsets, groupLengths) if length >= 2]
+            strandRuns = [(i, 1) for i, length in enumerate(groupLengths) if length >= 2]
+            lengths.extend(array.array('I', [length for _, length in cvRuns]))
+            for key in keys:
+                components = XGenChannelFormats[key][2]
+                columns[key].extend(takeRuns(channels[key][j], cvRuns if key in XGenCVChannels else strandRuns,
+                                             components))
+    return XGenStrands(lengths, columns.get('Positions'), columns.get('WIDTH_CV'), columns.get('FaceId'),
+                       columns.get('FaceUV'))
+
+
+def rootIndex2Order(faceIds, faceUVs):
+    # strands sorted by the (faceId, u, v) of their root, ties keep the strand order. index2order[i] is the sorted
+    # position of strand i. faceIds is one column per strand, faceUVs two (u, v), both flat
+    numCurves = len(faceIds)
+    if np is not None:
+        faceUVs = np.asarray(faceUVs).reshape(-1, 2)
+        # lexsort is stable and sorts by the last key first
+        order = np.lexsort((faceUVs[:, 1], faceUVs[:, 0], np.asarray(faceIds)))
+        index2order = np.empty(numCurves, dtype=np.int64)
+        index2order[order] = np.arange(numCurves)
+        return index2order
+    # one stable sort per key, least significant first, keyed straight on the columns
+    order = list(range(numCurves))
+    for column in (faceUVs[1::2], faceUVs[0::2], faceIds):
+        order.sort(key=column.__getitem__)
+    index2order = [0] * numCurves
+    for sortedIndex, i in enumerate(order):
+        index2order[i] = sortedIndex
+    return index2order
+
+
+def rootKeyBytes(faceIds, faceUVs):
+    # numpy only, the (faceId, u, v) of every strand as one 12 byte string that sorts and compares like the tuple:
+    # big endian words, faceId with its sign bit flipped, floats mapped onto the order of their values
+    keys = np.empty((len(faceIds), 3), dtype='>u4')
+    keys[:, 0] = np.asarray(faceIds, dtype=np.int64) + 0x80000000
+    bits = np.asarray(faceUVs, dtype=np.float32).reshape(-1, 2).view(np.uint32)
+    keys[:, 1:] = np.where(bits & 0x80000000, ~bits, bits | 0x80000000)
+    return keys.view('S12').reshape(-1)
+
+
+class XGenRootIndex:
+    # root keys of the first frame's strands, sorted, with the slot (strand index) each one belongs to. a later frame's
+    # strands are matched to their slot by binary search, strands sharing a key are matched in strand order
+    def __init__(self, faceIds, faceUVs):
+        self.numSlots = len(faceIds)
+        if np is not None:
+            keys = rootKeyBytes(faceIds, faceUVs)
+            self.slots = np.argsort(keys, kind='stable').astype(np.int32)
+            self.keys = keys[self.slots]
+        else:
+            keyed = sorted((key, slot) for slot, key in enumerate(self.rootKeys(faceIds, faceUVs)))
+            self.keys = [key for key, _ in keyed]
+            self.slots = array.array('i', [slot for _, slot in keyed])
+
+    @staticmethod
+    def rootKeys(faceIds, faceUVs):
+        return zip(faceIds, faceUVs[0::2], faceUVs[1::2])
+
+    def match(self, faceIds, faceUVs):
+        # slot of every strand, -1 for strands the first frame did not have
+        if np is not None:
+            keys = rootKeyBytes(faceIds, faceUVs)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            # rank of each strand among the strands sharing its key, the rank-th slot of that key is its match
+            runStarts = np.ones(len(keys), dtype=bool)
+            runStarts[1:] = keys[1:] != keys[:-1]
+            rank = np.arange(len(keys)) - np.flatnonzero(runStarts)[np.cumsum(runStarts) - 1]
+            candidates = np.searchsorted(self.keys, keys) + rank
+            found = candidates < self.numSlots
+            found[found] = self.keys[candidates[found]] == keys[found]
+            slots = np.full(len(keys), -1, dtype=np.int64)
+            slots[order[found]] = self.slots[candidates[found]]
+            return slots
+        ranks = dict()
+        slots = array.array('i', [-1]) * len(faceIds)
+        for i, key in enumerate(self.rootKeys(faceIds, faceUVs)):
+            rank = ranks.get(key, 0)
+            ranks[key] = rank + 1
+            j = bisect.bisect_left(self.keys, key) + rank
+            if j < self.numSlots and self.keys[j] == key:
+                slots[i] = self.slots[j]
+        return slots
+
+
+class XGenGatherPlan:
+    # the frame-invariant part of gatherStrands + XGenStrands.reorder, compiled once from the first frame: source CV
+    # of every destination CV, with short strands dropped and index2order applied (None keeps the gathered order).
+    # later frames only take their positions through it, the (strands, CVs) count of each group guards the topology.
+    # lengths are the CV counts of the destination strands.
+    # with slotLengths the destination is a fixed strand layout and index2order holds the slot of every strand: strands
+    # without one (-1) or with another CV count are dropped, slots nobody fills are missing and take copies them from
+    # the previous frame
+    def __init__(self, splineData, index2order=None, slotLengths=None):
+        infos, positions = self.read(splineData)
+        self.groupCounts = self.counts(infos, positions)
+        self.numMissing = 0
+        self.numDropped = 0
+        base = 0
+        if np is not None:
+            offsetParts = []
+            lengthParts = []
+            for (offsets, lengths), (_, numCVs) in zip(infos, self.groupCounts):
+                mask = lengths >= 2
+                offsetParts.append(offsets[mask].astype(np.int64) + base)
+                lengthParts.append(lengths[mask].astype(np.int64))
+                base += numCVs
+            offsets = np.concatenate(offsetParts) if offsetParts else np.zeros(0, dtype=np.int64)
+            lengths = np.concatenate(lengthParts) if lengthParts else np.zeros(0, dtype=np.int64)
+            if slotLengths is not None:
+                slots = np.asarray(index2order, dtype=np.int64)
+                slotLengths = np.asarray(slotLengths, dtype=np.int64)
+                placed = slots >= 0
+                placed[placed] = lengths[placed] == slotLengths[slots[placed]]
+                source = np.full(len(slotLengths), -1, dtype=np.int64)
+                source[slots[placed]] = np.flatnonzero(placed)
+                found = source >= 0
+                self.numDropped = len(lengths) - int(placed.sum())
+                self.numMissing = len(slotLengths) - int(found.sum())
+                # CVs of missing slots stay -1
+                slotStarts = np.cumsum(slotLengths) - slotLengths
+                self.cvIndex = np.full(int(slotLengths.sum()), -1, dtype=np.int32)
+                self.cvIndex[cvGatherIndex(slotStarts[found], slotLengths[found])] = cvGatherIndex(
+                    offsets[source[found]], slotLengths[found])
+                lengths = slotLengths
+            else:
+                if index2order is not None:
+                    order = np.empty(len(lengths), dtype=np.int64)
+                    order[np.asarray(index2order, dtype=np.int64)] = np.arange(len(lengths))
+                    offsets = offsets[order]
+                    lengths = lengths[order]
+                # int32 halves the plan, it is held for the whole animation
+                self.cvIndex = cvGatherIndex(offsets, lengths).astype(np.int32)
+            self.lengths = lengths.astype(np.int32)
+            self.numCurves = len(lengths)
+            self.numCVs = len(self.cvIndex)
+        else:
+            runs = []
+            for (offsets, lengths), (_, numCVs) in zip(infos, self.groupCounts):
+                runs.extend((base + offset, length) for offset, length in zip(offsets, lengths) if length >= 2)
+                base += numCVs
+            if slotLengths is not None:
+                source = [-1] * len(slotLengths)
+                for i, slot in enumerate(index2order):
+                    if slot >= 0 and runs[i][1] == slotLengths[slot]:
+                        source[slot] = i
+                self.numMissing = source.count(-1)
+                self.numDropped = len(runs) - (len(source) - self.numMissing)
+                # missing slots are runs without a start
+                runs = [runs[i] if i >= 0 else (None, length) for i, length in zip(source, slotLengths)]
+            elif index2order is not None:
+                order = [0] * len(runs)
+                for i, sortedIndex in enumerate(index2order):
+                    order[sortedIndex] = i
+                runs = [runs[i] for i in order]
+            self.cvRuns = runs
+            self.lengths = array.array('I', [length for _, length in runs])
+            self.numCurves = len(runs)
+            self.numCVs = sum(length for _, length in runs)
+
+    def sameLengths(self, other):
+        if np is not None:
+            return np.array_equal(self.lengths, other.lengths)
+        return self.lengths == other.lengths
+
+    @staticmethod
+    def read(splineData):
+        splineData.inflate(('PrimitiveInfos', 'Positions'))
+        return splineData.channel('PrimitiveInfos'), splineData.channel('Positions')
+
+    @staticmethod
+    def counts(infos, positions):
+        # numpy positions are (CVs, 3), array.array ones are flat
+        if np is not None:
+            return [(len(lengths), len(values)) for (_, lengths), values in zip(infos, positions)]
+        return [(len(lengths), len(values) // 3) for (_, lengths), values in zip(infos, positions)]
+
+    def take(self, splineData, previous=None):
+        # positions of a later frame in the first frame's strand order, one flat float array.
+        # previous holds the last frame's positions the same way, only needed when slots are missing
+        infos, positions = self.read(splineData)
+        counts = self.counts(infos, positions)
+        if counts != self.groupCounts:
+            raise Exception("XGen strand counts changed since the first frame (%d strands, %d CVs -> %d strands, "
+                            "%d CVs), the gather plan no longer applies" % (
+                                sum(c[0] for c in self.groupCounts), sum(c[1] for c in self.groupCounts),
+                                sum(c[0] for c in counts), sum(c[1] for c in counts)))
+        if np is not None:
+            source = np.concatenate(positions) if positions else np.zeros(0, dtype='<f4')
+            if not self.numMissing:
+                return source.reshape(-1, 3)[self.cvIndex].reshape(-1)
+            found = self.cvIndex >= 0
+            taken = np.array(previous, dtype=np.float32).reshape(-1, 3)
+            taken[found] = source.reshape(-1, 3)[self.cvIndex[found]]
+            return taken.reshape(-1)
+        source = array.array('f')
+        for values in positions:
+            source.extend(values)
+        if not self.numMissing:
+            return takeRuns(source, self.cvRuns, 3)
+        taken = array.array('f')
+        destination = 0
+        for start, count in self.cvRuns:
+            if start is None:
+                taken.extend(previous[destination * 3:(destination + count) * 3])
+            else:
+                taken.extend(source[start * 3:(start + count) * 3])
+            destination += count
+        return taken
+
+
+def matchGatherPlan(splineData, rootIndex, slotLengths):
+    # gather plan of a later frame onto the first frame's strand slots, strands matched by root key. only when no key
+    # matches at all (the roots moved along the surface) are the strands sorted again, if that keeps the CV counts
+    strands = gatherStrands(splineData, ('FaceId', 'FaceUV'))
+    gatherPlan = XGenGatherPlan(splineData, rootIndex.match(strands.faceIds, strands.faceUVs), slotLengths)
+    if gatherPlan.numMissing == gatherPlan.numCurves:
+        sortedPlan = XGenGatherPlan(splineData, rootIndex2Order(strands.faceIds, strands.faceUVs))
+        if sortedPlan.sameLengths(gatherPlan):
+            return sortedPlan
+    return gatherPlan
+
+
+def splineBlobHash(rawData):
+    # cheap fingerprint of a whole blob, used to skip frames where outSplineData did not change
+    return len(rawData), zlib.crc32(rawData) & 0xFFFFFFFF
+
+
+def loadSplineBlob(path):
+    with open(path, 'rb') as f:
+        return XGenSplineData(f.read())
+
+
+def main(paths):
+    for path in paths:
+        data = loadSplineBlob(path)
+        numCurves = sum(len(offsets) for offsets, _ in data.read(('PrimitiveInfos',))[0])
+        print("%s: %d bytes, %d groups, %d strands, %d with 2 or more CVs" % (
+            path, len(data.rawData), len(data.groupBlocks), numCurves, gatherStrands(data).numCurves))
+        print("  header: %s" % json.dumps(data.header))
+        for k in sorted(data.items):
+            print("  %s: %d blocks" % (k, len(data.items[k])))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -7,19 +7,109 @@ import maya.api.OpenMayaAnim as omAnim
 import maya.api.OpenMaya as om
 import imath
 import array
+import bisect
 import zlib
+import binascii
 import json
 import maya.cmds as cmds
 from typing import List
 import time
 import struct
+import itertools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import imathnumpy
+except ImportError:
+    imathnumpy = None
 
 # %%
 print_debug = False
+# deflated groups are inflated on a thread pool, zlib releases the GIL while inflating.
+# inflate_workers <= 1 keeps it serial, groups smaller than inflate_min_group_size (compressed bytes) stay serial
+inflate_workers = min(8, os.cpu_count() or 1)
+inflate_min_group_size = 64 * 1024
+# GroupBase64 groups are decoded this many base64 characters at a time, keep it a multiple of 4
+base64_chunk_size = 256 * 1024
 
 
 # %%
+# typecode of the numbers held by each imath array, components and element type of the vector arrays.
+# arrays not listed here (StringArray) are filled element by element
+ImathArrayFormats = {
+    imath.FloatArray: ('f', 1, None),
+    imath.IntArray: ('i', 1, None),
+    imath.ShortArray: ('h', 1, None),
+    imath.UnsignedCharArray: ('B', 1, None),
+    imath.V2fArray: ('f', 2, imath.V2f),
+    imath.V3fArray: ('f', 3, imath.V3f),
+}
+# the array types imathnumpy.arrayToNumpy converts, the others go through the buffer protocol
+ImathNumpyArrays = (imath.FloatArray, imath.IntArray, imath.V2fArray, imath.V3fArray)
+
+
+def imathArrayView(arr):
+    # writable view over the memory of an imath array, in order of preference: numpy array from imathnumpy,
+    # numpy array over the buffer protocol (PyImath 3.1+), byte memoryview when numpy is missing.
+    # None when the installed PyImath exposes neither
+    if np is not None and imathnumpy is not None and type(arr) in ImathNumpyArrays:
+        try:
+            return imathnumpy.arrayToNumpy(arr)
+        except TypeError:
+            # Boost.Python ArgumentError derives from TypeError, builds that convert fewer types fall back
+            pass
+    try:
+        view = memoryview(arr)
+    except TypeError:
+        return None
+    if view.readonly:
+        return None
+    if np is not None:
+        return np.asarray(view)
+    try:
+        return view.cast('B')
+    except (TypeError, ValueError):
+        return None
+
+
+def buffer2ImathArray(values, _type, arr=None):
+    # values is a flat numpy array, array.array or list, vector arrays take their components in a row.
+    # the imath array is filled in one copy when its memory can be viewed, element by element otherwise
+    # arr, when given, is refilled in place instead of allocating a new array
+    typecode, components, elementType = ImathArrayFormats[_type]
+    if arr is None:
+        arr = _type(len(values) // components)
+    view = imathArrayView(arr)
+    if isinstance(view, memoryview):
+        data = array.array(typecode, values).tobytes()
+        if len(data) == view.nbytes:
+            view[:] = data
+            return arr
+    elif view is not None and view.dtype == np.dtype(typecode) and view.size == len(values):
+        view[...] = np.asarray(values, dtype=typecode).reshape(view.shape)
+        return arr
+    if np is not None and isinstance(values, np.ndarray):
+        values = values.tolist()
+    if elementType is None:
+        for i, value in enumerate(values):
+            arr[i] = value
+    else:
+        it = iter(values)
+        for i, value in enumerate(zip(*[it] * components)):
+            arr[i] = elementType(*value)
+    return arr
+
+
 def list2ImathArray(l: list, _type):
+    if _type in ImathArrayFormats:
+        return buffer2ImathArray(l, _type)
     arr = _type(len(l))
     for i in range(len(l)):
         arr[i] = l[i]
@@ -27,126 +117,692 @@ def list2ImathArray(l: list, _type):
 
 
 def floatList2V3fArray(l: list):
-    arr = imath.V3fArray(len(l) // 3)
-    for i in range(len(arr)):
-        arr[i].x = l[i * 3]
-        arr[i].y = l[i * 3 + 1]
-        arr[i].z = l[i * 3 + 2]
-    return arr
+    return buffer2ImathArray(l, imath.V3fArray)
+
+
+def uniformKnots(lengths, degree):
+    # knot vectors of all strands in one flat float array: [0] * degree + range(m) + [m - 1] * degree per strand,
+    # m = numCVs - degree + 1 (the endpoint repeats one more than Maya)
+    if np is not None:
+        # knot j of a strand is j - degree, clamped to [0, m - 1]
+        lengths = np.asarray(lengths, dtype=np.int32)
+        counts = lengths + (degree + 1)
+        starts = np.cumsum(counts, dtype=np.int32) - counts
+        knots = np.arange(int(counts.sum()), dtype=np.int32)
+        knots -= np.repeat(starts + degree, counts)
+        clamped = knots < 0
+        np.minimum(knots, np.repeat(lengths - degree, counts), out=knots)
+        knots[clamped] = 0
+        return knots.astype(np.float32)
+    # strands share a handful of CV counts, build each knot vector once and join the bytes
+    vectors = dict()
+    for length in set(lengths):
+        knotsInsideNum = length - degree + 1
+        vectors[length] = array.array('f', [0] * degree + list(range(knotsInsideNum)) +
+                                      [knotsInsideNum - 1] * degree).tobytes()
+    knots = array.array('f')
+    knots.frombytes(b''.join([vectors[length] for length in lengths]))
+    return knots
+
+
+def rootBuffer(values):
+    # hair roots as one contiguous float32 buffer, (N, 3) with numpy, flat array.array otherwise
+    if np is not None:
+        return np.asarray(values, dtype=np.float32).reshape(-1, 3)
+    return array.array('f', values)
+
+
+def iterRootPoints(roots):
+    # om.MPoint per root of a rootBuffer, only for Maya calls that take one point at a time
+    if np is not None:
+        roots = roots.tolist()
+    else:
+        it = iter(roots)
+        roots = zip(*[it] * 3)
+    for x, y, z in roots:
+        yield om.MPoint(x, y, z)
 
 
 # %%
-def getXgenData(fnDepNode: om.MFnDependencyNode):
+# typecode, numpy dtype, components per element
+XGenChannelFormats = {
+    'Positions': ('f', '<f4', 3),
+    'WIDTH_CV': ('f', '<f4', 1),
+    'FaceUV': ('f', '<f4', 2),
+    'FaceId': ('i', '<i4', 1),
+}
+
+
+def decodeChannel(key, data):
+    typecode, dtype, components = XGenChannelFormats[key]
+    if np is not None:
+        # view over the inflated group buffer, no copy
+        values = np.frombuffer(data, dtype=dtype)
+        if components > 1:
+            values = values.reshape(-1, components)
+        return values
+    values = array.array(typecode)
+    values.frombytes(data)
+    return values
+
+
+if np is not None:
+    PrimitiveInfoDtype = np.dtype([('offset', '<u4'), ('length', '<u8')])
+
+
+def decodePrimitiveInfos(data):
+    # records are packed (uint32 offset, uint64 length), decoded in bulk into two parallel columns
+    if np is not None:
+        records = np.frombuffer(data, dtype=PrimitiveInfoDtype)
+        return records['offset'], records['length']
+    words = array.array('I')
+    words.frombytes(data)
+    if any(words[2::3]):
+        raise Exception("PrimitiveInfos length out of range")
+    return words[0::3], words[1::3]
+
+
+def iterBlocks(data):
+    # a block is a 16 byte header (uint32 type code, 4 unused bytes, uint64 size) followed by its data
+    dataLength = len(data)
+    address = 0
+    while address < dataLength - 1:
+        if address + 16 > dataLength:
+            raise Exception("Truncated block header at %d" % address)
+        type_code, size = struct.unpack_from('<I4xQ', data, address)
+        start = address + 16
+        end = start + size
+        if end > dataLength:
+            raise Exception("Block at %d is larger than the data (%d > %d)" % (address, end, dataLength))
+        yield start, end, type_code
+        address = end
+
+
+class XGenGroup:
+    # inflated group data, its block table is parsed once and blocks are served as views
+    def __init__(self, data):
+        self.data = data
+        self.view = memoryview(data)
+        self.blocks = list(iterBlocks(data))
+
+    def block(self, index):
+        start, end, _ = self.blocks[index]
+        return self.view[start:end]
+
+
+def inflateGroup(rawView, start, end):
+    # a deflated group is a 32 byte header followed by the zlib stream, only the group's own bytes are read
+    inflater = zlib.decompressobj()
+    data = inflater.decompress(rawView[start + 32:end])
+    if not inflater.eof:
+        raise Exception("Group data is truncated")
+    return data
+
+
+def decodeBase64Group(rawView, start, end, deflate):
+    # base64 text is decoded and inflated chunk by chunk, the decoded zlib stream is never held whole
+    inflater = zlib.decompressobj() if deflate else None
+    skip = 32 if deflate else 0
+    parts = []
+    for chunkStart in range(start, end, base64_chunk_size):
+        chunk = binascii.a2b_base64(rawView[chunkStart:min(chunkStart + base64_chunk_size, end)])
+        if skip:
+            skipped = min(skip, len(chunk))
+            chunk, skip = chunk[skipped:], skip - skipped
+        parts.append(inflater.decompress(chunk) if deflate else chunk)
+    if deflate and not inflater.eof:
+        raise Exception("Group data is truncated")
+    return b''.join(parts)
+
+
+def decodeGroup(rawView, start, end, header):
+    if header['GroupBase64']:
+        return decodeBase64Group(rawView, start, end, header['GroupDeflate'])
+    if header['GroupDeflate']:
+        return inflateGroup(rawView, start, end)
+    return rawView[start:end]
+
+
+def inflateGroups(rawView, dataBlocks, groups, header):
+    inflate = lambda group: decodeGroup(rawView, *dataBlocks[group][:2], header)
+    parallel = [group for group in groups if dataBlocks[group][1] - dataBlocks[group][0] >= inflate_min_group_size]
+    inflated = dict()
+    if inflate_workers > 1 and len(parallel) > 1:
+        with ThreadPoolExecutor(max_workers=min(inflate_workers, len(parallel))) as pool:
+            inflated.update(zip(parallel, pool.map(inflate, parallel)))
+    for group in groups:
+        if group not in inflated:
+            inflated[group] = inflate(group)
+    return inflated
+
+
+class XGenSplineData:
+    # parsed outSplineData blob: header, items, groups and decoded channels, no Maya needed
+    # previous is the XGenSplineData of the last frame, groups whose bytes did not change are taken from it until
+    # releasePrevious is called
+    def __init__(self, rawData, previous=None):
+        self.rawData = rawData
+        self.rawView = memoryview(rawData)
+        self.groupBlocks = list(iterBlocks(self.rawView))
+        headerBlock = self.groupBlocks.pop(0)
+        self.json = json.loads(bytes(self.rawView[headerBlock[0]:headerBlock[1]]))
+        self.header = self.json['Header']
+        self.items = dict()
+        for item in itertools.chain(self.json['Items'], self.json['RefMeshArray']):
+            for k, v in item.items():
+                if isinstance(v, int):
+                    self.items.setdefault(k, []).append((v >> 32, v & 0xFFFFFFFF))
+        self.groups = dict()
+        self.channels = dict()
+        self.groupHashes = dict()
+        self.reusedGroups = 0
+        self.previous = previous
+        if previous is not None:
+            # only keep one frame of history
+            previous.previous = None
+
+    def groupHash(self, group):
+        if group not in self.groupHashes:
+            start, end, _ = self.groupBlocks[group]
+            self.groupHashes[group] = zlib.crc32(self.rawView[start:end]) & 0xFFFFFFFF
+        return self.groupHashes[group]
+
+    def reuse(self, group):
+        # takes an inflated group and its decoded channels from the previous frame if its bytes are the same
+        previous = self.previous
+        if (previous is None or group not in previous.groups or group >= len(previous.groupBlocks)
+                or previous.header != self.header or previous.groupHash(group) != self.groupHash(group)):
+            return False
+        self.groups[group] = previous.groups[group]
+        for (key, addr), value in previous.channels.items():
+            if addr[0] == group:
+                self.channels[key, addr] = value
+        self.reusedGroups += 1
+        return True
+
+    def releasePrevious(self):
+        # the frame has been read: reused groups are held here, the previous blob and its other groups can go
+        self.previous = None
+
+    def hitRatio(self):
+        return float(self.reusedGroups) / len(self.groups) if self.groups else 0.0
+
+    def group(self, group):
+        if group not in self.groups and not self.reuse(group):
+            start, end, _ = self.groupBlocks[group]
+            self.groups[group] = XGenGroup(decodeGroup(self.rawView, start, end, self.header))
+        return self.groups[group]
+
+    def inflate(self, keys):
+        # inflate all groups holding these keys at once, so they can go through the thread pool
+        if not self.header['GroupDeflate'] and not self.header['GroupBase64']:
+            return
+        groups = sorted(set(addr[0] for k in keys for addr in self.items.get(k, ())).difference(self.groups))
+        groups = [group for group in groups if not self.reuse(group)]
+        for group, validData in inflateGroups(self.rawView, self.groupBlocks, groups, self.header).items():
+            self.groups[group] = XGenGroup(validData)
+
+    def block(self, group, index):
+        return self.group(group).block(index)
+
+    def decode(self, key, addr):
+        if (key, addr) not in self.channels:
+            data = self.block(*addr)
+            if key == 'PrimitiveInfos':
+                data = decodePrimitiveInfos(data)
+            elif key in XGenChannelFormats:
+                data = decodeChannel(key, data)
+            self.channels[key, addr] = data
+        return self.channels[key, addr]
+
+    def channel(self, key):
+        # one decoded entry per group, unknown keys are returned as raw block views
+        return [self.decode(key, addr) for addr in self.items.get(key, ())]
+
+    def read(self, keys):
+        self.inflate(keys)
+        return [self.channel(k) for k in keys]
+
+    def channelHash(self, keys):
+        # (bytes, crc32) over the raw blocks of these keys, their groups are inflated but nothing is decoded
+        self.inflate(keys)
+        numBytes = crc = 0
+        for k in keys:
+            for addr in self.items.get(k, ()):
+                data = self.block(*addr)
+                numBytes += len(data)
+                crc = zlib.crc32(data, crc)
+        return numBytes, crc & 0xFFFFFFFF
+
+
+# channels with one element per CV, the others have one element per strand
+XGenCVChannels = ('Positions', 'WIDTH_CV')
+
+
+def cvGatherIndex(offsets, lengths):
+    # numpy only, indices of offsets[i]:offsets[i] + lengths[i] for every strand, concatenated
+    starts = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum())) + np.repeat(offsets - starts, lengths)
+
+
+def takeRuns(values, runs, components):
+    # array.array only, values[start * components:(start + count) * components] for every (start, count), concatenated.
+    # adjacent runs are merged, so contiguous strands are copied with one slice
+    taken = array.array(values.typecode)
+    runStart = runEnd = None
+    for start, count in runs:
+        if start != runEnd:
+            if runEnd is not None:
+                taken.extend(values[runStart * components:runEnd * components])
+            runStart = start
+        runEnd = start + count
+    if runEnd is not None:
+        taken.extend(values[runStart * components:runEnd * components])
+    return taken
+
+
+class XGenStrands:
+    # all groups concatenated into contiguous, flat columns, strand i owns CVs offsets[i]:offsets[i + 1].
+    # positions hold 3 floats per CV, widths 1 per CV, faceIds 1 per strand, faceUVs 2 per strand
+    def __init__(self, lengths, positions=None, widths=None, faceIds=None, faceUVs=None):
+        self.lengths = lengths
+        self.numCurves = len(lengths)
+        if np is not None:
+            self.offsets = np.zeros(self.numCurves + 1, dtype=np.int64)
+            np.cumsum(lengths, out=self.offsets[1:])
+        else:
+            self.offsets = array.array('L', [0] * (self.numCurves + 1))
+            total = 0
+            for i, length in enumerate(lengths):
+                total += length
+                self.offsets[i + 1] = total
+        self.numCVs = int(self.offsets[-1])
+        self.positions = positions
+        self.widths = widths
+        self.faceIds = faceIds
+        self.faceUVs = faceUVs
+
+    def columns(self):
+        return dict(zip(('Positions', 'WIDTH_CV', 'FaceId', 'FaceUV'),
+                        (self.positions, self.widths, self.faceIds, self.faceUVs)))
+
+    def reorder(self, index2order):
+        # returns a new container where strand i is moved to index2order[i]
+        columns = dict()
+        if np is not None:
+            order = np.empty(self.numCurves, dtype=np.int64)
+            order[np.asarray(index2order, dtype=np.int64)] = np.arange(self.numCurves)
+            lengths = self.lengths[order]
+            cvIndex = cvGatherIndex(self.offsets[:-1][order], lengths)
+            for key, values in self.columns().items():
+                if values is not None:
+                    components = XGenChannelFormats[key][2]
+                    rows = cvIndex if key in XGenCVChannels else order
+                    columns[key] = values.reshape(-1, components)[rows].reshape(-1)
+        else:
+            order = [0] * self.numCurves
+            for i, sortedIndex in enumerate(index2order):
+                order[sortedIndex] = i
+            lengths = array.array('I', [self.lengths[i] for i in order])
+            cvRuns = [(self.offsets[i], self.lengths[i]) for i in order]
+            strandRuns = [(i, 1) for i in order]
+            for key, values in self.columns().items():
+                if values is not None:
+                    components = XGenChannelFormats[key][2]
+                    columns[key] = takeRuns(values, cvRuns if key in XGenCVChannels else strandRuns, components)
+        return XGenStrands(lengths, columns.get('Positions'), columns.get('WIDTH_CV'), columns.get('FaceId'),
+                           columns.get('FaceUV'))
+
+    def roots(self):
+        # first CV of every strand, float32 (numCurves, 3) with numpy, flat array.array otherwise
+        if np is not None:
+            return self.positions.reshape(-1, 3)[self.offsets[:-1]]
+        return takeRuns(self.positions, [(offset, 1) for offset in self.offsets[:-1]], 3)
+
+
+def gatherStrands(splineData, keys=()):
+    # keys are any of XGenChannelFormats, strands with less than 2 CVs are dropped from every column
+    splineData.inflate(('PrimitiveInfos',) + tuple(keys))
+    infos = splineData.channel('PrimitiveInfos')
+    channels = dict((key, splineData.channel(key)) for key in keys)
+    if np is not None:
+        lengthParts = []
+        parts = dict((key, []) for key in keys)
+        for j, (offsets, lengths) in enumerate(infos):
+            mask = lengths >= 2
+            offsets = offsets[mask].astype(np.int64)
+            lengths = lengths[mask].astype(np.int64)
+            cvIndex = cvGatherIndex(offsets, lengths)
+            lengthParts.append(lengths)
+            for key in keys:
+                components = XGenChannelFormats[key][2]
+                rows = cvIndex if key in XGenCVChannels else mask
+                parts[key].append(channels[key][j].reshape(-1, components)[rows].reshape(-1))
+        lengths = np.concatenate(lengthParts) if lengthParts else np.zeros(0, dtype=np.int64)
+        columns = dict((key, np.concatenate(parts[key]) if parts[key] else
+                        np.zeros(0, dtype=XGenChannelFormats[key][1])) for key in keys)
+    else:
+        lengths = array.array('I')
+        columns = dict((key, array.array(XGenChannelFormats[key][0])) for key in keys)
+        for j, (offsets, groupLengths) in enumerate(infos):
+            cvRuns = [(offset, length) for offset, length in zip(offsets, groupLengths) if length >= 2]
+            strandRuns = [(i, 1) for i, length in enumerate(groupLengths) if length >= 2]
+            lengths.extend(array.array('I', [length for _, length in cvRuns]))
+            for key in keys:
+                components = XGenChannelFormats[key][2]
+                columns[key].extend(takeRuns(channels[key][j], cvRuns if key in XGenCVChannels else strandRuns,
+                                             components))
+    return XGenStrands(lengths, columns.get('Positions'), columns.get('WIDTH_CV'), columns.get('FaceId'),
+                       columns.get('FaceUV'))
+
+
+def rootIndex2Order(faceIds, faceUVs):
+    # strands sorted by the (faceId, u, v) of their root, ties keep the strand order. index2order[i] is the sorted
+    # position of strand i. faceIds is one column per strand, faceUVs two (u, v), both flat
+    numCurves = len(faceIds)
+    if np is not None:
+        faceUVs = np.asarray(faceUVs).reshape(-1, 2)
+        # lexsort is stable and sorts by the last key first
+        order = np.lexsort((faceUVs[:, 1], faceUVs[:, 0], np.asarray(faceIds)))
+        index2order = np.empty(numCurves, dtype=np.int64)
+        index2order[order] = np.arange(numCurves)
+        return index2order
+    # one stable sort per key, least significant first, keyed straight on the columns
+    order = list(range(numCurves))
+    for column in (faceUVs[1::2], faceUVs[0::2], faceIds):
+        order.sort(key=column.__getitem__)
+    index2order = [0] * numCurves
+    for sortedIndex, i in enumerate(order):
+        index2order[i] = sortedIndex
+    return index2order
+
+
+def rootKeyBytes(faceIds, faceUVs):
+    # numpy only, the (faceId, u, v) of every strand as one 12 byte string that sorts and compares like the tuple:
+    # big endian words, faceId with its sign bit flipped, floats mapped onto the order of their values
+    keys = np.empty((len(faceIds), 3), dtype='>u4')
+    keys[:, 0] = np.asarray(faceIds, dtype=np.int64) + 0x80000000
+    bits = np.asarray(faceUVs, dtype=np.float32).reshape(-1, 2).view(np.uint32)
+    keys[:, 1:] = np.where(bits & 0x80000000, ~bits, bits | 0x80000000)
+    return keys.view('S12').reshape(-1)
+
+
+class XGenRootIndex:
+    # root keys of the first frame's strands, sorted, with the slot (strand index) each one belongs to. a later frame's
+    # strands are matched to their slot by binary search, strands sharing a key are matched in strand order
+    def __init__(self, faceIds, faceUVs):
+        self.numSlots = len(faceIds)
+        if np is not None:
+            keys = rootKeyBytes(faceIds, faceUVs)
+            self.slots = np.argsort(keys, kind='stable').astype(np.int32)
+            self.keys = keys[self.slots]
+        else:
+            keyed = sorted((key, slot) for slot, key in enumerate(self.rootKeys(faceIds, faceUVs)))
+            self.keys = [key for key, _ in keyed]
+            self.slots = array.array('i', [slot for _, slot in keyed])
+
+    @staticmethod
+    def rootKeys(faceIds, faceUVs):
+        return zip(faceIds, faceUVs[0::2], faceUVs[1::2])
+
+    def match(self, faceIds, faceUVs):
+        # slot of every strand, -1 for strands the first frame did not have
+        if np is not None:
+            keys = rootKeyBytes(faceIds, faceUVs)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            # rank of each strand among the strands sharing its key, the rank-th slot of that key is its match
+            runStarts = np.ones(len(keys), dtype=bool)
+            runStarts[1:] = keys[1:] != keys[:-1]
+            rank = np.arange(len(keys)) - np.flatnonzero(runStarts)[np.cumsum(runStarts) - 1]
+            candidates = np.searchsorted(self.keys, keys) + rank
+            found = candidates < self.numSlots
+            found[found] = self.keys[candidates[found]] == keys[found]
+            slots = np.full(len(keys), -1, dtype=np.int64)
+            slots[order[found]] = self.slots[candidates[found]]
+            return slots
+        ranks = dict()
+        slots = array.array('i', [-1]) * len(faceIds)
+        for i, key in enumerate(self.rootKeys(faceIds, faceUVs)):
+            rank = ranks.get(key, 0)
+            ranks[key] = rank + 1
+            j = bisect.bisect_left(self.keys, key) + rank
+            if j < self.numSlots and self.keys[j] == key:
+                slots[i] = self.slots[j]
+        return slots
+
+
+class XGenGatherPlan:
+    # the frame-invariant part of gatherStrands + XGenStrands.reorder, compiled once from the first frame: source CV
+    # of every destination CV, with short strands dropped and index2order applied (None keeps the gathered order).
+    # later frames only take their positions through it, the (strands, CVs) count of each group guards the topology.
+    # lengths are the CV counts of the destination strands.
+    # with slotLengths the destination is a fixed strand layout and index2order holds the slot of every strand: strands
+    # without one (-1) or with another CV count are dropped, slots nobody fills are missing and take copies them from
+    # the previous frame
+    def __init__(self, splineData, index2order=None, slotLengths=None):
+        infos, positions = self.read(splineData)
+        self.groupCounts = self.counts(infos, positions)
+        self.numMissing = 0
+        self.numDropped = 0
+        base = 0
+        if np is not None:
+            offsetParts = []
+            lengthParts = []
+            for (offsets, lengths), (_, numCVs) in zip(infos, self.groupCounts):
+                mask = lengths >= 2
+                offsetParts.append(offsets[mask].astype(np.int64) + base)
+                lengthParts.append(lengths[mask].astype(np.int64))
+                base += numCVs
+            offsets = np.concatenate(offsetParts) if offsetParts else np.zeros(0, dtype=np.int64)
+            lengths = np.concatenate(lengthParts) if lengthParts else np.zeros(0, dtype=np.int64)
+            if slotLengths is not None:
+                slots = np.asarray(index2order, dtype=np.int64)
+                slotLengths = np.asarray(slotLengths, dtype=np.int64)
+                placed = slots >= 0
+                placed[placed] = lengths[placed] == slotLengths[slots[placed]]
+                source = np.full(len(slotLengths), -1, dtype=np.int64)
+                source[slots[placed]] = np.flatnonzero(placed)
+                found = source >= 0
+                self.numDropped = len(lengths) - int(placed.sum())
+                self.numMissing = len(slotLengths) - int(found.sum())
+                # CVs of missing slots stay -1
+                slotStarts = np.cumsum(slotLengths) - slotLengths
+                self.cvIndex = np.full(int(slotLengths.sum()), -1, dtype=np.int32)
+                self.cvIndex[cvGatherIndex(slotStarts[found], slotLengths[found])] = cvGatherIndex(
+                    offsets[source[found]], slotLengths[found])
+                lengths = slotLengths
+            else:
+                if index2order is not None:
+                    order = np.empty(len(lengths), dtype=np.int64)
+                    order[np.asarray(index2order, dtype=np.int64)] = np.arange(len(lengths))
+                    offsets = offsets[order]
+                    lengths = lengths[order]
+                # int32 halves the plan, it is held for the whole animation
+                self.cvIndex = cvGatherIndex(offsets, lengths).astype(np.int32)
+            self.lengths = lengths.astype(np.int32)
+            self.numCurves = len(lengths)
+            self.numCVs = len(self.cvIndex)
+        else:
+            runs = []
+            for (offsets, lengths), (_, numCVs) in zip(infos, self.groupCounts):
+                runs.extend((base + offset, length) for offset, length in zip(offsets, lengths) if length >= 2)
+                base += numCVs
+            if slotLengths is not None:
+                source = [-1] * len(slotLengths)
+                for i, slot in enumerate(index2order):
+                    if slot >= 0 and runs[i][1] == slotLengths[slot]:
+                        source[slot] = i
+                self.numMissing = source.count(-1)
+                self.numDropped = len(runs) - (len(source) - self.numMissing)
+                # missing slots are runs without a start
+                runs = [runs[i] if i >= 0 else (None, length) for i, length in zip(source, slotLengths)]
+            elif index2order is not None:
+                order = [0] * len(runs)
+                for i, sortedIndex in enumerate(index2order):
+                    order[sortedIndex] = i
+                runs = [runs[i] for i in order]
+            self.cvRuns = runs
+            self.lengths = array.array('I', [length for _, length in runs])
+            self.numCurves = len(runs)
+            self.numCVs = sum(length for _, length in runs)
+
+    def sameLengths(self, other):
+        if np is not None:
+            return np.array_equal(self.lengths, other.lengths)
+        return self.lengths == other.lengths
+
+    @staticmethod
+    def read(splineData):
+        splineData.inflate(('PrimitiveInfos', 'Positions'))
+        return splineData.channel('PrimitiveInfos'), splineData.channel('Positions')
+
+    @staticmethod
+    def counts(infos, positions):
+        # numpy positions are (CVs, 3), array.array ones are flat
+        if np is not None:
+            return [(len(lengths), len(values)) for (_, lengths), values in zip(infos, positions)]
+        return [(len(lengths), len(values) // 3) for (_, lengths), values in zip(infos, positions)]
+
+    def take(self, splineData, previous=None):
+        # positions of a later frame in the first frame's strand order, one flat float array.
+        # previous holds the last frame's positions the same way, only needed when slots are missing
+        infos, positions = self.read(splineData)
+        counts = self.counts(infos, positions)
+        if counts != self.groupCounts:
+            raise Exception("XGen strand counts changed since the first frame (%d strands, %d CVs -> %d strands, "
+                            "%d CVs), the gather plan no longer applies" % (
+                                sum(c[0] for c in self.groupCounts), sum(c[1] for c in self.groupCounts),
+                                sum(c[0] for c in counts), sum(c[1] for c in counts)))
+        if np is not None:
+            source = np.concatenate(positions) if positions else np.zeros(0, dtype='<f4')
+            if not self.numMissing:
+                return source.reshape(-1, 3)[self.cvIndex].reshape(-1)
+            found = self.cvIndex >= 0
+            taken = np.array(previous, dtype=np.float32).reshape(-1, 3)
+            taken[found] = source.reshape(-1, 3)[self.cvIndex[found]]
+            return taken.reshape(-1)
+        source = array.array('f')
+        for values in positions:
+            source.extend(values)
+        if not self.numMissing:
+            return takeRuns(source, self.cvRuns, 3)
+        taken = array.array('f')
+        destination = 0
+        for start, count in self.cvRuns:
+            if start is None:
+                taken.extend(previous[destination * 3:(destination + count) * 3])
+            else:
+                taken.extend(source[start * 3:(start + count) * 3])
+            destination += count
+        return taken
+
+
+def matchGatherPlan(splineData, rootIndex, slotLengths):
+    # gather plan of a later frame onto the first frame's strand slots, strands matched by root key. only when no key
+    # matches at all (the roots moved along the surface) are the strands sorted again, if that keeps the CV counts
+    strands = gatherStrands(splineData, ('FaceId', 'FaceUV'))
+    gatherPlan = XGenGatherPlan(splineData, rootIndex.match(strands.faceIds, strands.faceUVs), slotLengths)
+    if gatherPlan.numMissing == gatherPlan.numCurves:
+        sortedPlan = XGenGatherPlan(splineData, rootIndex2Order(strands.faceIds, strands.faceUVs))
+        if sortedPlan.sameLengths(gatherPlan):
+            return sortedPlan
+    return gatherPlan
+
+
+def splineBlobHash(rawData):
+    # cheap fingerprint of a whole blob, used to skip frames where outSplineData did not change
+    return len(rawData), zlib.crc32(rawData) & 0xFFFFFFFF
+
+
+def residentMemory():
+    # current resident memory (working set) of the Maya process in bytes, None where it cannot be read
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    # second field of statm is the resident page count, linux only
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryWatch:
+    # resident memory sampled during one export, after every written frame. the process peak (ru_maxrss,
+    # PeakWorkingSetSize) would hide an export that stays below an earlier peak of the session
+    def __init__(self):
+        self.start = residentMemory()
+        self.peak = self.start
+
+    def sample(self):
+        if self.start is not None:
+            self.peak = max(self.peak, residentMemory())
+
+    def report(self):
+        if self.start is None:
+            return
+        end = residentMemory()
+        self.peak = max(self.peak, end)
+        print("Resident memory %.0f MB before the export, %.0f MB at its peak (%+.0f MB), %.0f MB after." % (
+            self.start / 1048576.0, self.peak / 1048576.0, (self.peak - self.start) / 1048576.0, end / 1048576.0))
+
+
+def getSplineBlob(fnDepNode: om.MFnDependencyNode):
     splineData: om.MPlug = fnDepNode.findPlug("outSplineData", False)
 
     handle: om.MDataHandle = splineData.asMObject()
     mdata = om.MFnPluginData(handle)
     mData = mdata.data()
 
-    rawData = mData.writeBinary()
-
-    def GetBlocks(bype_data):
-        address = 0
-        i = 0
-        blocks = []
-        maxIt = 100
-        while address < len(bype_data) - 1:
-            size = int.from_bytes(bype_data[address + 8:address + 16], byteorder='little', signed=False)
-            type_code = int.from_bytes(bype_data[address:address + 4], byteorder='little', signed=False)
-            blocks.append((address + 16, address + 16 + size, type_code))
-            address += size + 16
-            i += 1
-            if i > maxIt:
-                break
-        return blocks
-
-    dataBlocks = GetBlocks(rawData)
-    headerBlock = dataBlocks[0]
-    dataBlocks.pop(0)
-
-    dataJson = json.loads(rawData[headerBlock[0]:headerBlock[1]])
-    # print(dataJson)
-    Header = dataJson['Header']
-
-    Items = dict()
-
-    def readItems(items):
-        for k, v in items:
-            if isinstance(v, int):
-                group = v >> 32
-                index = v & 0xFFFFFFFF
-                addr = (group, index)
-                if k not in Items:
-                    Items[k] = [addr]
-                else:
-                    Items[k].append(addr)
-
-    for i in range(len(dataJson['Items'])):
-        readItems(dataJson['Items'][i].items())
-    for i in range(len(dataJson['RefMeshArray'])):
-        readItems(dataJson['RefMeshArray'][i].items())
-
-    # print(Items)
-    decompressedData = dict()
-
-    def decompressData(group, index):
-        if group not in decompressedData:
-            if Header['GroupBase64']:
-                raise Exception("我还没有碰到Base64的情况，请提醒我更新代码")
-            if Header['GroupDeflate']:
-                validData = zlib.decompress(rawData[dataBlocks[group][0] + 32:])
-            else:
-                validData = rawData[dataBlocks[group][0]:dataBlocks[group][1]]
-            decompressedData[group] = validData
-        else:
-            validData = decompressedData[group]
-        blocks = GetBlocks(validData)
-        return validData[blocks[index][0]:blocks[index][1]]
-
-    PrimitiveInfosList = []
-    PositionsDataList = []
-    WidthsDataList = []
-    for k, v in Items.items():
-        # print(k, len(v))
-        if k == 'PrimitiveInfos':
-            dtype_format = '<IQ'
-            for addr in v:
-                decompressed_data = decompressData(*addr)  # 假设解压缩返回字节流
-                PrimitiveInfos = []
-                record_size = struct.calcsize(dtype_format)
-                for i in range(0, len(decompressed_data), record_size):
-                    PrimitiveInfo = struct.unpack_from(f'{dtype_format}', decompressed_data, i)
-                    PrimitiveInfos.append(PrimitiveInfo)
-
-                PrimitiveInfosList.append(PrimitiveInfos)
-
-        if k == 'Positions':
-            for addr in v:
-                decompressed_data = decompressData(*addr)
-                posData = array.array('f', decompressed_data)
-
-                PositionsDataList.append(posData)
-
-        if k == 'WIDTH_CV':
-            for addr in v:
-                decompressed_data = decompressData(*addr)
-                widthData = array.array('f', decompressed_data)
-                WidthsDataList.append(widthData)
-
-    return PrimitiveInfosList, PositionsDataList, WidthsDataList
+    return mData.writeBinary()
+
+
+def captureSplineBlobs(fnDepNode: om.MFnDependencyNode, startFrame, endFrame, directory):
+    # writes the outSplineData blob of each frame to disk, XGenSplineData.py reads them without Maya
+    oldCurTime = omAnim.MAnimControl.currentTime()
+    name = fnDepNode.name().replace(':', '_').replace('|', '_')
+    paths = []
+    for frame in range(startFrame, endFrame + 1):
+        om.MGlobal.viewFrame(frame)
+        path = os.path.join(directory, "%s.%04d.bin" % (name, frame))
+        with open(path, 'wb') as f:
+            f.write(getSplineBlob(fnDepNode))
+        paths.append(path)
+    omAnim.MAnimControl.setCurrentTime(oldCurTime)
+    return paths
 
 
 # %%
 class CurvesProxy:
     def __init__(self, curveObj: abcGeom.OCurves, fnDepNode: om.MFnDependencyNode, needBakeUV=False, animation=False):
-        self.hairRootList = None
+        self.hairRoots = None
         self.schema: abcGeom.OCurvesSchema = curveObj.getSchema()
         self.needBakeUV = needBakeUV
         self.animation = animation
-        self.firstSamp = abcGeom.OCurvesSchemaSample()
         self.fnDepNode = fnDepNode
         self.curves = None
         self.groupName = None
+        self.skippedFrames = 0
+        # first frame topology and the two samples later frames are written through, see frame_sample
+        self.topology = None
+        self.frameSamples = []
+        self.frameIndex = 1
+        self.frameAllocations = 0
+        self.animatedFrames = 0
 
     def write_group_name(self, group_name: str):
         cp: abc.OCompoundProperty = self.schema.getArbGeomParams()
@@ -165,6 +821,42 @@ class CurvesProxy:
         _id = abc.OInt32ArrayProperty(cp, "groom_group_id")
         _id.setValue(list2ImathArray([group_id], imath.IntArray))
 
+    def set_topology(self, samp, curveType, nVertices, orders, knots, widths=None):
+        # the first frame's topology arrays are held once and attached by reference to every later sample
+        self.topology = (curveType, nVertices, orders, knots, widths)
+        self.attach_topology(samp)
+
+    def attach_topology(self, samp):
+        curveType, nVertices, orders, knots, widths = self.topology
+        samp.setBasis(abcGeom.BasisType.kBsplineBasis)
+        samp.setWrap(abcGeom.CurvePeriodicity.kNonPeriodic)
+        samp.setType(curveType)
+        samp.setCurvesNumVertices(nVertices)
+        samp.setOrders(orders)
+        samp.setKnots(knots)
+        if widths is not None:
+            samp.setWidths(widths)
+
+    def frame_sample(self, positions):
+        # later frames alternate between two samples, each owning a position array that is refilled in place.
+        # the one written last frame stays intact, so it can be set again for an unchanged frame.
+        # frameAllocations counts the samples and arrays that still had to be allocated
+        self.animatedFrames += 1
+        self.frameIndex = 1 - self.frameIndex
+        if len(self.frameSamples) == self.frameIndex:
+            samp = abcGeom.OCurvesSchemaSample()
+            self.attach_topology(samp)
+            self.frameSamples.append([samp, None])
+            self.frameAllocations += 1
+        entry = self.frameSamples[self.frameIndex]
+        numCVs = len(positions) // 3
+        if entry[1] is None or len(entry[1]) != numCVs:
+            entry[1] = imath.V3fArray(numCVs)
+            self.frameAllocations += 1
+        buffer2ImathArray(positions, imath.V3fArray, entry[1])
+        entry[0].setPositions(entry[1])
+        return entry[0]
+
     def write_first_frame(self):
         itDag = om.MItDag()
         itDag.reset(self.fnDepNode.object(), om.MItDag.kDepthFirst, om.MFn.kCurve)
@@ -181,25 +873,20 @@ class CurvesProxy:
 
         curve = om.MFnNurbsCurve(self.curves[0])
 
-        orders = imath.IntArray(numCurves)
-        nVertices = imath.IntArray(numCurves)
+        orders = [0] * numCurves
+        nVertices = [0] * numCurves
         pointslist = []
         knots = []
         if self.needBakeUV:
-            self.hairRootList = []
-
-        samp = self.firstSamp
-        samp.setBasis(abcGeom.BasisType.kBsplineBasis)
-        samp.setWrap(abcGeom.CurvePeriodicity.kNonPeriodic)
+            roots = []
 
         if curve.degree == 3:
-            samp.setType(abcGeom.CurveType.kCubic)
+            curveType = abcGeom.CurveType.kCubic
         elif curve.degree == 1:
-            samp.setType(abcGeom.CurveType.kLinear)
+            curveType = abcGeom.CurveType.kLinear
         else:
-            # samp.setType(abcGeom.CurveType.kVariableOrder)
-            samp.setType(abcGeom.CurveType.kLinear)
-            pass
+            # curveType = abcGeom.CurveType.kVariableOrder
+            curveType = abcGeom.CurveType.kLinear
         for i in range(numCurves):
             curve = curve.setObject(self.curves[i])
             numCVs = curve.numCVs
@@ -211,7 +898,7 @@ class CurvesProxy:
                 pointslist.append(cvArray[j].y)
                 pointslist.append(cvArray[j].z)
             if self.needBakeUV:
-                self.hairRootList.append(cvArray[0])
+                roots += (cvArray[0].x, cvArray[0].y, cvArray[0].z)
             knotsArray = curve.knots()
             if len(knotsArray) > 1:
                 knotsLength = len(knotsArray)
@@ -229,10 +916,12 @@ class CurvesProxy:
                     knots.append(float(knotsArray[knotsLength - 1]))
                 else:
                     knots.append(float(2 * knotsArray[knotsLength - 1] - knotsArray[knotsLength - 2]))
-        samp.setCurvesNumVertices(nVertices)
+        if self.needBakeUV:
+            self.hairRoots = rootBuffer(roots)
+        samp = abcGeom.OCurvesSchemaSample()
+        self.set_topology(samp, curveType, list2ImathArray(nVertices, imath.IntArray),
+                          list2ImathArray(orders, imath.UnsignedCharArray), list2ImathArray(knots, imath.FloatArray))
         samp.setPositions(floatList2V3fArray(pointslist))
-        samp.setOrders(list2ImathArray(orders, imath.UnsignedCharArray))
-        samp.setKnots(list2ImathArray(knots, imath.FloatArray))
 
         # widths = list2ImathArray([0.1], imath.FloatArray)
         # widths = abc.Float32TPTraits()
@@ -246,14 +935,6 @@ class CurvesProxy:
             return
         curve = om.MFnNurbsCurve(self.curves[0])
 
-        samp = abcGeom.OCurvesSchemaSample()
-        samp.setBasis(self.firstSamp.getBasis())
-        samp.setWrap(self.firstSamp.getWrap())
-        samp.setType(self.firstSamp.getType())
-        samp.setCurvesNumVertices(self.firstSamp.getCurvesNumVertices())
-        samp.setOrders(self.firstSamp.getOrders())
-        samp.setKnots(self.firstSamp.getKnots())
-
         pointslist = []
         for i in range(numCurves):
             curve = curve.setObject(self.curves[i])
@@ -264,12 +945,10 @@ class CurvesProxy:
                 pointslist.append(cvArray[j].y)
                 pointslist.append(cvArray[j].z)
 
-        samp.setPositions(floatList2V3fArray(pointslist))
-
-        self.schema.set(samp)
+        self.schema.set(self.frame_sample(pointslist))
 
     def bake_uv(self, bakeMesh: om.MFnMesh, uv_set: str = None):
-        if self.hairRootList is None:
+        if self.hairRoots is None:
             return
         if bakeMesh is None:
             return
@@ -278,87 +957,65 @@ class CurvesProxy:
         elif uv_set not in bakeMesh.getUVSetNames():
             raise Exception(f'Invalid UV Set : {uv_set}')
 
-        uvs = imath.V2fArray(len(self.hairRootList))
-        for i, hairRoot in enumerate(self.hairRootList):
+        uvs = []
+        for hairRoot in iterRootPoints(self.hairRoots):
             res = bakeMesh.getUVAtPoint(hairRoot, om.MSpace.kWorld, uvSet=uv_set)
-            uvs[i].x = res[0]
-            uvs[i].y = res[1]
+            uvs.append(res[0])
+            uvs.append(res[1])
 
         cp: abc.OCompoundProperty = self.schema.getArbGeomParams()
         uv_prop = abc.OV2fArrayProperty(cp, "groom_root_uv")
-        uv_prop.setValue(uvs)
+        uv_prop.setValue(buffer2ImathArray(uvs, imath.V2fArray))
 
 
 class XGenProxy(CurvesProxy):
     def __init__(self, curveObj: abcGeom.OCurves, fnDepNode: om.MFnDependencyNode, needBakeUV=False, animation=False):
         super().__init__(curveObj, fnDepNode, needBakeUV, animation)
+        self.lastBlobHash = None
+        self.lastSamp = None
+        self.splineData = None
+        self.gatherPlan = None
+
+    def read_spline_blob(self):
+        # returns None when outSplineData is byte-identical to the last written frame
+        blob = getSplineBlob(self.fnDepNode)
+        blobHash = splineBlobHash(blob)
+        if blobHash == self.lastBlobHash and self.lastSamp is not None:
+            return None
+        self.lastBlobHash = blobHash
+        return blob
 
     def write_first_frame(self):
         if print_debug:
             startTime = time.time()
-        PrimitiveInfosList, PositionsDataList, WidthsDataList = getXgenData(self.fnDepNode)
+        blob = getSplineBlob(self.fnDepNode)
+        self.lastBlobHash = splineBlobHash(blob)
+        self.splineData = XGenSplineData(blob)
+        strands = gatherStrands(self.splineData, ('Positions', 'WIDTH_CV'))
+        if self.animation:
+            self.gatherPlan = XGenGatherPlan(self.splineData)
         if print_debug:
             print("getXgenData: %.4f" % (time.time() - startTime))
             startTime = time.time()
-        numCurves = 0
-        numCVs = 0
-        for i, PrimitiveInfos in enumerate(PrimitiveInfosList):
-            numCurves += len(PrimitiveInfos)
-            for PrimitiveInfo in PrimitiveInfos:
-                numCVs += PrimitiveInfo[1]
-
-        orders = imath.UnsignedCharArray(numCurves)
-        nVertices = imath.IntArray(numCurves)
-        cp: abc.OCompoundProperty = self.schema.getArbGeomParams()
+        numCurves = strands.numCurves
 
-        samp = self.firstSamp
-        samp.setBasis(abcGeom.BasisType.kBsplineBasis)
-        samp.setWrap(abcGeom.CurvePeriodicity.kNonPeriodic)
-        samp.setType(abcGeom.CurveType.kCubic)
+        cp: abc.OCompoundProperty = self.schema.getArbGeomParams()
 
         degree = 3
-        pointArray = imath.V3fArray(numCVs)
-        widthArray = imath.FloatArray(numCVs)
+        pointArray = buffer2ImathArray(strands.positions, imath.V3fArray)
+        widthArray = buffer2ImathArray(strands.widths, imath.FloatArray)
+        orders = list2ImathArray([degree + 1] * numCurves, imath.UnsignedCharArray)
+        nVertices = buffer2ImathArray(strands.lengths, imath.IntArray)
         if self.needBakeUV:
-            self.hairRootList = []
-        knots = []
+            self.hairRoots = strands.roots()
 
-        curveIndex = 0
-        cvIndex = 0
-
-        for j in range(len(PrimitiveInfosList)):
-            PrimitiveInfos = PrimitiveInfosList[j]
-            posData = PositionsDataList[j]
-            widthData = WidthsDataList[j]
-            for i, PrimitiveInfo in enumerate(PrimitiveInfos):
-                offset = PrimitiveInfo[0]
-                length = int(PrimitiveInfo[1])
-                if length < 2:
-                    continue
-                startAddr = offset * 3
-                for k in range(length):
-                    pointArray[cvIndex].x = posData[startAddr]
-                    pointArray[cvIndex].y = posData[startAddr + 1]
-                    pointArray[cvIndex].z = posData[startAddr + 2]
-                    if k == 0 and self.needBakeUV:
-                        self.hairRootList.append(om.MPoint(pointArray[cvIndex]))
-                    widthArray[cvIndex] = widthData[offset + k]
-                    startAddr += 3
-                    cvIndex += 1
-
-                orders[curveIndex] = degree + 1
-                nVertices[curveIndex] = length
-
-                knotsInsideNum = length - degree + 1
-                knotsList = [*([0] * degree), *list(range(knotsInsideNum)),
-                             *([knotsInsideNum - 1] * degree )]
-                knots += knotsList
-                curveIndex += 1
+        knots = uniformKnots(strands.lengths, degree)
+        widths = abcGeom.OFloatGeomParamSample(widthArray, abcGeom.GeometryScope.kVertexScope)
 
-        samp.setCurvesNumVertices(nVertices)
+        samp = abcGeom.OCurvesSchemaSample()
+        self.set_topology(samp, abcGeom.CurveType.kCubic, nVertices, orders,
+                          buffer2ImathArray(knots, imath.FloatArray), widths)
         samp.setPositions(pointArray)
-        samp.setKnots(list2ImathArray(knots, imath.FloatArray))
-        samp.setOrders(orders)
 
         # bake vertex color example
         # cvColor = abcGeom.OC3fGeomParam(cp, "groom_color", False, abcGeom.GeometryScope.kVertexScope, 1)
@@ -375,10 +1032,12 @@ class XGenProxy(CurvesProxy):
         # cvColorArray = abcGeom.OC3fGeomParamSample(cvColorArray, abcGeom.GeometryScope.kVertexScope)
         # cvColor.set(cvColorArray)
 
-        # write width
-        widths = abcGeom.OFloatGeomParamSample(widthArray, abcGeom.GeometryScope.kVertexScope)
-        samp.setWidths(widths)
         self.schema.set(samp)
+        self.lastSamp = samp
+        if not self.animation:
+            # no later frame is written, the parsed blob and the last sample are not read again
+            self.splineData = None
+            self.lastSamp = None
 
         if print_debug:
             print("write_first_frame: %.4f" % (time.time() - startTime))
@@ -386,51 +1045,23 @@ class XGenProxy(CurvesProxy):
     def write_frame(self):
         if print_debug:
             startTime = time.time()
-        PrimitiveInfosList, PositionsDataList, WidthsDataList = getXgenData(self.fnDepNode)
-        numCurves = 0
-        numCVs = 0
-        for i, PrimitiveInfos in enumerate(PrimitiveInfosList):
-            numCurves += len(PrimitiveInfos)
-            for PrimitiveInfo in PrimitiveInfos:
-                numCVs += PrimitiveInfo[1]
+        blob = self.read_spline_blob()
+        if blob is None:
+            self.schema.set(self.lastSamp)
+            self.skippedFrames += 1
+            return
+        self.splineData = XGenSplineData(blob, self.splineData)
+        positions = self.gatherPlan.take(self.splineData)
+        self.splineData.releasePrevious()
+        if print_debug:
+            print("group reuse: %d/%d (%.0f%%)" % (self.splineData.reusedGroups, len(self.splineData.groups),
+                                                   self.splineData.hitRatio() * 100))
 
         cp: abc.OCompoundProperty = self.schema.getArbGeomParams()
 
-        samp = abcGeom.OCurvesSchemaSample()
-        samp.setBasis(self.firstSamp.getBasis())
-        samp.setWrap(self.firstSamp.getWrap())
-        samp.setType(self.firstSamp.getType())
-
-        samp.setCurvesNumVertices(self.firstSamp.getCurvesNumVertices())
-        samp.setKnots(self.firstSamp.getKnots())
-        samp.setOrders(self.firstSamp.getOrders())
-        samp.setWidths(self.firstSamp.getWidths())
-
-        pointArray = imath.V3fArray(numCVs)
-
-        curveIndex = 0
-        cvIndex = 0
-        for j in range(len(PrimitiveInfosList)):
-            PrimitiveInfos = PrimitiveInfosList[j]
-            posData = PositionsDataList[j]
-            for i, PrimitiveInfo in enumerate(PrimitiveInfos):
-                offset = PrimitiveInfo[0]
-                length = int(PrimitiveInfo[1])
-                if length < 2:
-                    continue
-                startAddr = offset * 3
-                for k in range(length):
-                    pointArray[cvIndex].x = posData[startAddr]
-                    pointArray[cvIndex].y = posData[startAddr + 1]
-                    pointArray[cvIndex].z = posData[startAddr + 2]
-                    startAddr += 3
-                    cvIndex += 1
-
-                curveIndex += 1
-
-        samp.setPositions(pointArray)
-
+        samp = self.frame_sample(positions)
         self.schema.set(samp)
+        self.lastSamp = samp
         if print_debug:
             print("write_frame: %.4f" % (time.time() - startTime))
 
@@ -673,6 +1304,7 @@ class SaveXGenWindow(QtWidgets.QDialog):
         else:
             return
         startTime = time.time()
+        memoryWatch = MemoryWatch()
         oldCurTime = omAnim.MAnimControl.currentTime()
         archive = abc.OArchive(file_path[0])
 
@@ -743,13 +1375,24 @@ class SaveXGenWindow(QtWidgets.QDialog):
                         item.write_first_frame()
                     elif item.animation:
                         item.write_frame()
+                    memoryWatch.sample()
             omAnim.MAnimControl.setCurrentTime(oldCurTime)
         else:
             for item in proxyList:
                 item.write_first_frame()
+                memoryWatch.sample()
         for item in proxyList:
             item.bake_uv(self.bakeMesh, self.uvSetStr.text())
         print("Data has been saved in %s, it took %.2f seconds." % (file_path[0], time.time() - startTime))
+        memoryWatch.report()
+        skippedFrames = sum(item.skippedFrames for item in proxyList)
+        if skippedFrames:
+            print("%d unchanged XGen frames reused the previous sample." % skippedFrames)
+        animatedFrames = sum(item.animatedFrames for item in proxyList)
+        if animatedFrames:
+            frameAllocations = sum(item.frameAllocations for item in proxyList)
+            print("%d sample allocations over %d animated frames (%.2f per frame)." % (
+                frameAllocations, animatedFrames, float(frameAllocations) / animatedFrames))
 
         return file_path[0]
 
@@ -0,0 +1,151 @@
+"""Maya-free checks of the outSplineData parser, run with python -m unittest discover tests"""
+import array
+import base64
+import json
+import os
+import random
+import struct
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import XGenSplineBench as xsb
+import XGenSplineData as xsd
+
+
+def packStrands(strands):
+    # one deflated group from explicit (length, faceId, u, v, positions) strands
+    lengths = [strand[0] for strand in strands]
+    offsets = [sum(lengths[:i]) for i in range(len(lengths))]
+    infos = array.array('I', [0] * (len(strands) * 3))
+    infos[0::3] = array.array('I', offsets)
+    infos[1::3] = array.array('I', lengths)
+    channels = [
+        ('PrimitiveInfos', infos.tobytes()),
+        ('Positions', array.array('f', [p for strand in strands for p in strand[4]]).tobytes()),
+        ('WIDTH_CV', array.array('f', [0.05] * sum(lengths)).tobytes()),
+        ('FaceId', array.array('i', [strand[1] for strand in strands]).tobytes()),
+        ('FaceUV', array.array('f', [c for strand in strands for c in strand[2:4]]).tobytes()),
+    ]
+    groupData = b''.join(xsb.packBlock(xsb.ChannelBlockType, payload) for _, payload in channels)
+    compressed = zlib.compress(groupData)
+    groupData = struct.pack('<QQ16x', len(groupData), len(compressed)) + compressed
+    item = dict((key, index) for index, (key, _) in enumerate(channels))
+    header = {'Header': {'GroupBase64': False, 'GroupDeflate': True}, 'Items': [item], 'RefMeshArray': []}
+    return bytearray(xsb.packBlock(xsb.HeaderBlockType, json.dumps(header).encode()) +
+                     xsb.packBlock(xsb.GroupBlockType, groupData))
+
+
+class StrandMatchTest(unittest.TestCase):
+    def firstFrame(self, strands):
+        splineData = xsd.XGenSplineData(packStrands(strands))
+        gathered = xsd.gatherStrands(splineData, ('Positions', 'FaceId', 'FaceUV'))
+        index2order = xsd.rootIndex2Order(gathered.faceIds, gathered.faceUVs)
+        gathered = gathered.reorder(index2order)
+        plan = xsd.XGenGatherPlan(splineData, index2order)
+        return gathered, plan, xsd.XGenRootIndex(gathered.faceIds, gathered.faceUVs)
+
+    def testOneRemovedOneAddedKeepsSlots(self):
+        # uniform CV counts, so sorting the changed frame would keep the lengths and shift strands between slots
+        rnd = random.Random(7)
+        strands = [(4, rnd.randrange(4), rnd.random(), rnd.random(), [rnd.uniform(-1, 1) for _ in range(12)])
+                   for _ in range(32)]
+        first, plan, rootIndex = self.firstFrame(strands)
+        moved = [(length, faceId, u, v, [p * 2.0 for p in positions])
+                 for length, faceId, u, v, positions in strands]
+        moved.pop(9)
+        moved.insert(20, (4, 5, 0.5, 0.5, [9.0] * 12))
+
+        splineData = xsd.XGenSplineData(packStrands(moved))
+        matched = xsd.matchGatherPlan(splineData, rootIndex, plan.lengths)
+        self.assertEqual((matched.numMissing, matched.numDropped), (1, 1))
+        positions = list(matched.take(splineData, first.positions))
+
+        byKey = dict(((faceId, u, v), positions) for _, faceId, u, v, positions in moved)
+        previous = list(first.positions)
+        faceUVs = list(first.faceUVs)
+        expected = []
+        for slot, faceId in enumerate(first.faceIds):
+            key = (int(faceId), faceUVs[slot * 2], faceUVs[slot * 2 + 1])
+            match = [values for (f, u, v), values in byKey.items()
+                     if (f, array.array('f', [u])[0], array.array('f', [v])[0]) == key]
+            expected.extend(match[0] if match else previous[slot * 12:(slot + 1) * 12])
+        self.assertEqual(positions, list(array.array('f', expected)))
+
+    def testMovedRootsAreSortedAgain(self):
+        rnd = random.Random(3)
+        strands = [(4, rnd.randrange(4), rnd.random(), rnd.random(), [rnd.uniform(-1, 1) for _ in range(12)])
+                   for _ in range(16)]
+        _, plan, rootIndex = self.firstFrame(strands)
+        slid = [(length, faceId, u, (v + 0.25) % 1.0, positions) for length, faceId, u, v, positions in strands]
+        splineData = xsd.XGenSplineData(packStrands(slid))
+        matched = xsd.matchGatherPlan(splineData, rootIndex, plan.lengths)
+        self.assertEqual((matched.numMissing, matched.numDropped, matched.numCurves), (0, 0, 16))
+
+
+def referenceBlocks(groupData, header):
+    # payloads of the channel blocks in one group, decoded with plain b64decode + decompress
+    if header['GroupBase64']:
+        groupData = base64.b64decode(groupData)
+    if header['GroupDeflate']:
+        groupData = zlib.decompress(groupData[32:])
+    blocks = []
+    position = 0
+    while position < len(groupData):
+        _, size = struct.unpack_from('<I4xQ', groupData, position)
+        blocks.append(groupData[position + 16:position + 16 + size])
+        position += 16 + size
+    return blocks
+
+
+class BlobDecodeTest(unittest.TestCase):
+    def setUp(self):
+        self.chunkSize = xsd.base64_chunk_size
+
+    def tearDown(self):
+        xsd.base64_chunk_size = self.chunkSize
+
+    def checkBlob(self, blob):
+        data = xsd.XGenSplineData(blob)
+        for key, addrs in data.items.items():
+            for group, index in addrs:
+                start, end, _ = data.groupBlocks[group]
+                expected = referenceBlocks(bytes(blob[start:end]), data.header)[index]
+                self.assertEqual(bytes(data.block(group, index)), expected)
+                if key in xsd.XGenChannelFormats:
+                    self.assertEqual(bytes(data.decode(key, (group, index))), expected)
+
+    def testEncodings(self):
+        for deflate in (True, False):
+            for base64Groups in (False, True):
+                blob = xsb.makeSplineBlob(500, (2, 9), 3, deflate=deflate, base64Groups=base64Groups, seed=5)
+                self.checkBlob(blob)
+
+    def testBase64ChunkBoundaries(self):
+        # chunks shorter than the 32 byte deflate header, odd multiples of 4, and one chunk for the whole group
+        for chunkSize in (4, 8, 28, 36, 1020, 4096, 1 << 20):
+            xsd.base64_chunk_size = chunkSize
+            for deflate in (True, False):
+                blob = xsb.makeSplineBlob(300, (2, 9), 2, deflate=deflate, base64Groups=True, seed=chunkSize)
+                self.checkBlob(blob)
+
+
+class GroupReuseTest(unittest.TestCase):
+    def testReleasedFrameKeepsReusedGroups(self):
+        blob = xsb.makeSplineBlob(200, (2, 9), 3, seed=3)
+        first = xsd.XGenSplineData(blob)
+        expected = [bytes(values) for values in first.channel('Positions')]
+        second = xsd.XGenSplineData(bytearray(blob), first)
+        self.assertEqual([bytes(values) for values in second.channel('Positions')], expected)
+        second.releasePrevious()
+        self.assertIsNone(second.previous)
+        self.assertEqual(second.reusedGroups, len(second.groups))
+        third = xsd.XGenSplineData(bytearray(blob), second)
+        self.assertEqual([bytes(values) for values in third.channel('Positions')], expected)
+        self.assertEqual(third.reusedGroups, len(third.groups))
+
+
+if __name__ == '__main__':
+    unittest.main()